@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-15 15:15
+
+from django.db import migrations, models
+
+
+def mark_existing_documents_completed(apps, schema_editor):
+    # Documents uploaded before this migration were extracted synchronously
+    Document = apps.get_model("api", "Document")
+    Document.objects.update(status="completed")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0002_document_content_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("completed", "Completed"),
+                    ("failed", "Failed"),
+                ],
+                default="pending",
+                max_length=16,
+            ),
+        ),
+        migrations.RunPython(
+            mark_existing_documents_completed, migrations.RunPython.noop
+        ),
+    ]
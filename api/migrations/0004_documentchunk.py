@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-15 15:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0003_document_status"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DocumentChunk",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("index", models.PositiveIntegerField()),
+                ("text", models.TextField()),
+                ("embedding", models.JSONField()),
+                ("document", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="chunks", to="api.document")),
+            ],
+            options={
+                "ordering": ["index"],
+            },
+        ),
+    ]
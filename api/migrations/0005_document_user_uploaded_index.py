@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-15 15:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_documentchunk"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="document",
+            index=models.Index(fields=["user", "-uploaded_at"], name="api_doc_user_uploaded_idx"),
+        ),
+    ]
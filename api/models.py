@@ -2,6 +2,16 @@ from django.db import models
 from django.contrib.auth.models import User # Django's built-in User model
 
 class Document(models.Model):
+    # Text extraction runs in a Celery worker (see api/tasks.py), so track its progress
+    STATUS_PENDING = 'pending'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='documents')
     title = models.CharField(max_length=255)
     # Files will be stored in MEDIA_ROOT/user_documents/
@@ -9,6 +19,27 @@ class Document(models.Model):
     file = models.FileField(upload_to='user_documents/')
     uploaded_at = models.DateTimeField(auto_now_add=True)
     extracted_text = models.TextField(blank=True, null=True) # To store text from the file
+    # SHA-256 of the file bytes, lets us skip re-extraction when the same file is uploaded again
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+
+    class Meta:
+        # Matches the document list query: a user's documents, newest first
+        indexes = [models.Index(fields=['user', '-uploaded_at'], name='api_doc_user_uploaded_idx')]
+
+    def __str__(self):
+        return f"{self.title} (Uploaded by: {self.user.username})"
+
+class DocumentChunk(models.Model):
+    # A slice of a document's extracted text plus its embedding, used to pick
+    # only the relevant parts of long documents for AI questions
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField() # Position of the chunk within the document
+    text = models.TextField()
+    embedding = models.JSONField() # List of floats from the embedding model
+
+    class Meta:
+        ordering = ['index']
 
     def __str__(self):
-        return f"{self.title} (Uploaded by: {self.user.username})"
\ No newline at end of file
+        return f"Chunk {self.index} of {self.document.title}"
@@ -41,9 +41,9 @@ class DocumentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Document
         # 'file' is for upload, 'file_url' is for read
-        fields = ('id', 'user', 'title', 'file', 'file_url', 'uploaded_at', 'extracted_text')
+        fields = ('id', 'user', 'title', 'file', 'file_url', 'uploaded_at', 'status', 'extracted_text')
         # 'file' field should be writable for uploads, but its URL is read-only
-        read_only_fields = ('user', 'uploaded_at', 'extracted_text', 'file_url')
+        read_only_fields = ('user', 'uploaded_at', 'status', 'extracted_text', 'file_url')
         extra_kwargs = {
             'file': {'write_only': True} # Use file for upload, file_url for retrieval
         }
@@ -52,4 +52,13 @@ class DocumentSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if obj.file and request:
             return request.build_absolute_uri(obj.file.url)
-        return None
\ No newline at end of file
+        return None
+
+class DocumentListSerializer(DocumentSerializer):
+    """
+    Lighter serializer for the list endpoint: leaves out 'extracted_text',
+    which can be very large and is deferred in the list queryset.
+    """
+    class Meta(DocumentSerializer.Meta):
+        fields = ('id', 'user', 'title', 'file', 'file_url', 'uploaded_at', 'status')
+        read_only_fields = ('user', 'uploaded_at', 'status', 'file_url')
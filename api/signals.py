@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Document
+from .tasks import delete_stored_file
+
+def _delete_stored_file(storage, name):
+    """
+    Deletes a file through its storage backend once the current transaction commits.
+    Local files are removed right away; remote storage (e.g. S3) is handed to a
+    Celery worker so the request isn't blocked on a network DELETE.
+    """
+    try:
+        storage.path(name)
+        is_local = True
+    except NotImplementedError: # Remote storage has no local path
+        is_local = False
+
+    if is_local:
+        transaction.on_commit(lambda: storage.delete(name))
+    else:
+        transaction.on_commit(lambda: delete_stored_file.delay(name))
+
+@receiver(pre_save, sender=Document)
+def remember_old_file(sender, instance, **kwargs):
+    """
+    Records the name of the file currently stored for this document,
+    so post_save can delete it if the upload replaced or cleared it.
+    """
+    instance._old_file_name = None
+    if instance.pk:
+        instance._old_file_name = Document.objects.filter(pk=instance.pk).values_list('file', flat=True).first()
+
+@receiver(post_save, sender=Document)
+def delete_replaced_file(sender, instance, **kwargs):
+    """
+    Deletes the previous file from storage after a document's file was replaced or cleared.
+    """
+    old_file_name = getattr(instance, '_old_file_name', None)
+    if old_file_name and old_file_name != instance.file.name:
+        _delete_stored_file(instance.file.storage, old_file_name)
+
+@receiver(post_delete, sender=Document)
+def delete_file_with_document(sender, instance, **kwargs):
+    """
+    Deletes a document's file from storage when the document is deleted
+    (including cascades, e.g. when its user is deleted).
+    """
+    if instance.file:
+        _delete_stored_file(instance.file.storage, instance.file.name)
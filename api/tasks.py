@@ -0,0 +1,89 @@
+from celery import shared_task
+from django.db import transaction
+
+from .models import Document, DocumentChunk
+from .utils import extract_text_from_file_cached, split_text_into_chunks, embed_texts, EXTRACTION_ERROR_PREFIX, DOC_EXTRACTION_ERROR_PREFIX
+
+@shared_task
+def extract_document_text(document_id):
+    """
+    Extracts text from a stored Document's file in the background and
+    saves it along with the resulting status, then indexes its chunks for ask_ai.
+    """
+    try:
+        document = Document.objects.get(pk=document_id)
+    except Document.DoesNotExist:
+        return # Deleted before the worker got to it
+
+    # Every write below is conditional on the file not having been replaced since we loaded it,
+    # so a slow task for an older file can't overwrite the newer file's text
+    current_document = Document.objects.filter(pk=document_id, content_hash=document.content_hash)
+
+    if not document.file:
+        if current_document.update(extracted_text="", status=Document.STATUS_COMPLETED):
+            DocumentChunk.objects.filter(document_id=document_id).delete()
+        return
+
+    try:
+        with document.file.open('rb') as file_obj:
+            extracted_text = extract_text_from_file_cached(file_obj, document.content_hash or None)
+    except Exception as e: # e.g. file missing from storage
+        print(f"Error opening file for document {document_id}: {str(e)}")
+        extracted_text = f"{EXTRACTION_ERROR_PREFIX}: {str(e)}"
+
+    if extracted_text.startswith((EXTRACTION_ERROR_PREFIX, DOC_EXTRACTION_ERROR_PREFIX)):
+        new_status = Document.STATUS_FAILED
+    else:
+        new_status = Document.STATUS_COMPLETED
+
+    # Only touch the fields we own, the user may have edited e.g. the title meanwhile
+    if not current_document.update(extracted_text=extracted_text, status=new_status):
+        return # The file was replaced (or the document deleted) while we were extracting
+
+    if new_status == Document.STATUS_COMPLETED:
+        index_document_chunks(document_id, document.content_hash)
+    else:
+        DocumentChunk.objects.filter(document_id=document_id).delete()
+
+@shared_task
+def index_document_chunks(document_id, content_hash):
+    """
+    Splits a Document's extracted text into chunks and stores an embedding for each,
+    replacing any chunks from a previous file. ask_ai uses these to send only the
+    most relevant parts of long documents to the AI model.
+    Does nothing if the document's file no longer has content_hash (it was replaced meanwhile).
+    """
+    current_document = Document.objects.filter(pk=document_id, content_hash=content_hash)
+    if not current_document.exists():
+        return
+    extracted_text = current_document.values_list('extracted_text', flat=True).first()
+
+    chunks = []
+    if extracted_text:
+        chunk_texts = split_text_into_chunks(extracted_text)
+        try:
+            embeddings = embed_texts(chunk_texts)
+            if len(embeddings) != len(chunk_texts): # zip() below would silently drop chunks
+                raise ValueError(f"got {len(embeddings)} embeddings for {len(chunk_texts)} chunks")
+        except Exception as e:
+            # Without chunks ask_ai falls back to (truncated) full text, so this isn't fatal
+            print(f"Error embedding chunks for document {document_id}: {str(e)}")
+            embeddings = []
+        chunks = [
+            DocumentChunk(document_id=document_id, index=i, text=chunk_text, embedding=embedding)
+            for i, (chunk_text, embedding) in enumerate(zip(chunk_texts, embeddings))
+        ]
+
+    with transaction.atomic():
+        # Check again, embedding can take a while
+        if not current_document.select_for_update().exists():
+            return
+        DocumentChunk.objects.filter(document_id=document_id).delete()
+        DocumentChunk.objects.bulk_create(chunks)
+
+@shared_task
+def delete_stored_file(name):
+    """
+    Deletes a Document file from storage in the background (used for remote storage backends).
+    """
+    Document._meta.get_field('file').storage.delete(name)
@@ -1,3 +1,402 @@
-from django.test import TestCase
+import os
+import shutil
+import subprocess
+import tempfile
+from unittest import mock
+
+import pymupdf
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import Document, DocumentChunk
+from .tasks import extract_document_text, index_document_chunks
+from .views import AI_CONTEXT_MAX_CHARS, DocumentViewSet
+from .utils import (compute_file_hash, extract_text_from_file, extract_text_from_file_cached,
+                    get_cached_extracted_text, split_text_into_chunks, EXTRACTION_ERROR_PREFIX,
+                    DOC_EXTRACTION_ERROR_PREFIX)
+
+
+class DocumentListTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password='pass12345!')
+        for i in range(5):
+            Document.objects.create(
+                user=self.user,
+                title=f'Doc {i}',
+                file=f'user_documents/doc_{i}.txt',
+                extracted_text=f'Text {i}',
+                status=Document.STATUS_COMPLETED,
+            )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_list_query_count_does_not_grow_with_documents(self):
+        # One query to authenticate the user, one to count for pagination, one for the page (owner joined in)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('document-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(response.data['results'][0]['user'], 'alice')
+
+    def test_list_omits_extracted_text(self):
+        response = self.client.get(reverse('document-list'))
+        self.assertNotIn('extracted_text', response.data['results'][0])
+
+    def test_list_is_paginated(self):
+        for i in range(5, 30):
+            Document.objects.create(user=self.user, title=f'Doc {i}', file=f'user_documents/doc_{i}.txt')
+        response = self.client.get(reverse('document-list'))
+        self.assertEqual(response.data['count'], 30)
+        self.assertEqual(len(response.data['results']), 25)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_retrieve_includes_extracted_text(self):
+        document = Document.objects.get(title='Doc 0')
+        response = self.client.get(reverse('document-detail', args=[document.id]))
+        self.assertEqual(response.data['extracted_text'], 'Text 0')
+
+
+class SplitTextIntoChunksTests(SimpleTestCase):
+    def test_empty_text_has_no_chunks(self):
+        self.assertEqual(split_text_into_chunks("   "), [])
+
+    def test_chunks_overlap_and_cover_all_words(self):
+        words = [f"w{i}" for i in range(25)]
+        chunks = split_text_into_chunks(" ".join(words), chunk_size=10, overlap=2)
+        self.assertEqual(chunks[0].split(), words[0:10])
+        self.assertEqual(chunks[1].split(), words[8:18])
+        self.assertEqual(chunks[-1].split()[-1], "w24")
+
+
+
+class AskAIValidationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bob', email='bob@example.com', password='pass12345!')
+        self.client.force_authenticate(self.user)
+
+    def ask(self, document):
+        return self.client.post(reverse('document-ask-ai', args=[document.id]), {'question': 'What is this?'}, format='json')
+
+    def test_pending_document_returns_conflict(self):
+        document = Document.objects.create(user=self.user, title='Pending', file='user_documents/p.pdf',
+                                           extracted_text='', status=Document.STATUS_PENDING)
+        self.assertEqual(self.ask(document).status_code, 409)
+
+    def test_unsuitable_extracted_text_is_rejected(self):
+        for extracted_text in ("No text content could be extracted from the document.",
+                               "An error occurred during text extraction: boom",
+                               "Could not reliably extract text from .doc file: boom"):
+            document = Document.objects.create(user=self.user, title='Bad', file='user_documents/b.doc',
+                                               extracted_text=extracted_text, status=Document.STATUS_COMPLETED)
+            self.assertEqual(self.ask(document).status_code, 400, extracted_text)
+
+
+# OLE compound document header, what legacy .doc files start with
+DOC_FILE_CONTENT = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1' + b'\x00' * 600
+
+
+class DocExtractionTests(SimpleTestCase):
+    def extract(self, **run_kwargs):
+        with mock.patch('api.utils.subprocess.run', **run_kwargs) as run:
+            text = extract_text_from_file(SimpleUploadedFile('old.doc', DOC_FILE_CONTENT))
+        return text, run
+
+    def test_antiword_output_is_used(self):
+        text, run = self.extract(return_value=subprocess.CompletedProcess([], 0, stdout=b'Word text', stderr=b''))
+        self.assertEqual(text, 'Word text')
+        self.assertEqual(run.call_args.args[0][0], 'antiword')
+
+    def test_antiword_failure_is_reported(self):
+        text, _ = self.extract(return_value=subprocess.CompletedProcess([], 1, stdout=b'', stderr=b'not a Word file'))
+        self.assertEqual(text, f"{DOC_EXTRACTION_ERROR_PREFIX}: not a Word file")
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_missing_antiword_is_reported_and_not_cached(self):
+        with mock.patch('api.utils.subprocess.run', side_effect=FileNotFoundError('antiword')):
+            upload = SimpleUploadedFile('old.doc', DOC_FILE_CONTENT)
+            content_hash = compute_file_hash(upload)
+            text = extract_text_from_file_cached(upload, content_hash)
+        self.assertTrue(text.startswith(DOC_EXTRACTION_ERROR_PREFIX))
+        self.assertIsNone(get_cached_extracted_text(content_hash))
+
+
+SAMPLE_PDF_PATH = os.path.join(settings.BASE_DIR, 'media', 'user_documents', 'Intern_Selection_Assignment.pdf')
+
+
+class PdfExtractionTests(SimpleTestCase):
+    def test_pdf_upload_is_extracted_from_stream(self):
+        with open(SAMPLE_PDF_PATH, 'rb') as pdf:
+            upload = SimpleUploadedFile('assignment.pdf', pdf.read(), content_type='application/pdf')
+        with mock.patch('api.utils.pymupdf.open', wraps=pymupdf.open) as pdf_open:
+            text = extract_text_from_file(upload)
+        self.assertIn('Intern Selection Assignment', text)
+        self.assertIn('stream', pdf_open.call_args.kwargs)
+
+    def test_spooled_upload_is_opened_from_its_temporary_path(self):
+        upload = TemporaryUploadedFile('assignment.pdf', 'application/pdf', 0, None)
+        self.addCleanup(upload.close)
+        with open(SAMPLE_PDF_PATH, 'rb') as pdf:
+            upload.write(pdf.read())
+        upload.seek(0)
+        with mock.patch('api.utils.pymupdf.open', wraps=pymupdf.open) as pdf_open:
+            text = extract_text_from_file(upload)
+        self.assertIn('Intern Selection Assignment', text)
+        self.assertEqual(pdf_open.call_args.args[0], upload.temporary_file_path())
+
+    def test_stored_file_is_opened_from_its_storage_path(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with self.settings(MEDIA_ROOT=media_root):
+            document = Document(title='Assignment')
+            with open(SAMPLE_PDF_PATH, 'rb') as pdf:
+                document.file.save('assignment.pdf', ContentFile(pdf.read()), save=False)
+            # What the extraction worker passes in
+            with mock.patch('api.utils.pymupdf.open', wraps=pymupdf.open) as pdf_open, \
+                 document.file.open('rb') as file_obj:
+                text = extract_text_from_file(file_obj)
+            self.assertIn('Intern Selection Assignment', text)
+            self.assertEqual(pdf_open.call_args.args[0], document.file.path)
+
+
+class ExtractTextFromFileTests(SimpleTestCase):
+    def test_plain_text_with_unknown_extension(self):
+        upload = SimpleUploadedFile('notes.md', b'# Heading\nSome notes', content_type='application/octet-stream')
+        self.assertEqual(extract_text_from_file(upload), '# Heading\nSome notes')
+
+    def test_json_in_txt_file_is_read_as_text(self):
+        upload = SimpleUploadedFile('a.txt', b'{"a": 1}')
+        self.assertEqual(extract_text_from_file(upload), '{"a": 1}')
+
+    def test_binary_content_with_txt_extension_is_unsupported(self):
+        upload = SimpleUploadedFile('fake.txt', bytes(range(256)) * 4, content_type='text/plain')
+        self.assertEqual(extract_text_from_file(upload), 'Unsupported file type or content not recognized as plain text.')
+
+
+# Tests don't have Redis; a LocMemCache is shared here because tasks run in the test process
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DocumentUploadTestCase(APITestCase):
+    """
+    Base for tests that upload files: stores them in a temporary MEDIA_ROOT and runs
+    extraction tasks inline instead of sending them to a Celery broker.
+    """
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_settings = self.settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.media_root = media_root
+
+        cache.clear()
+        self.user = User.objects.create_user(username='carol', email='carol@example.com', password='pass12345!')
+        self.client.force_authenticate(self.user)
+
+        extract_patch = mock.patch.object(extract_document_text, 'delay', side_effect=extract_document_text)
+        self.extract_delay = extract_patch.start()
+        self.addCleanup(extract_patch.stop)
+        index_patch = mock.patch.object(index_document_chunks, 'delay')
+        self.index_delay = index_patch.start()
+        self.addCleanup(index_patch.stop)
+        # The Gemini embedding API isn't reachable from tests
+        embed_patch = mock.patch('api.tasks.embed_texts', side_effect=lambda texts: [[1.0] for _ in texts])
+        embed_patch.start()
+        self.addCleanup(embed_patch.stop)
+
+    def upload(self, name, content, title='Doc'):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('document-list'),
+                                        {'title': title, 'file': SimpleUploadedFile(name, content)}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        return Document.objects.get(pk=response.data['id'])
+
+    def replace_file(self, document, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('document-detail', args=[document.id]),
+                                         {'file': SimpleUploadedFile(name, content)}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.data)
+        document.refresh_from_db()
+        return document
+
+
+class ExtractionCacheTests(DocumentUploadTestCase):
+    def test_duplicate_upload_uses_cached_text_without_queuing_task(self):
+        first = self.upload('manual.txt', b'Shared manual text')
+        self.assertEqual(first.status, Document.STATUS_COMPLETED)
+        self.assertEqual(self.extract_delay.call_count, 1)
+
+        second = self.upload('manual_copy.txt', b'Shared manual text')
+        self.assertEqual(second.status, Document.STATUS_COMPLETED)
+        self.assertEqual(second.extracted_text, 'Shared manual text')
+        self.assertEqual(self.extract_delay.call_count, 1) # No task for the duplicate
+
+    def test_unreachable_cache_counts_as_miss(self):
+        broken_cache = mock.Mock()
+        broken_cache.get.side_effect = ConnectionError('Error 111 connecting to localhost:6379')
+        broken_cache.set.side_effect = ConnectionError('Error 111 connecting to localhost:6379')
+        with mock.patch('api.utils.cache', broken_cache):
+            document = self.upload('manual.txt', b'Manual text')
+        self.assertEqual(document.status, Document.STATUS_COMPLETED)
+        self.assertEqual(document.extracted_text, 'Manual text')
+
+    def test_patch_with_identical_bytes_keeps_text_without_queuing_task(self):
+        document = self.upload('manual.txt', b'Manual text')
+        self.assertEqual(self.extract_delay.call_count, 1)
+
+        document = self.replace_file(document, 'manual_again.txt', b'Manual text')
+        self.assertEqual(document.extracted_text, 'Manual text')
+        self.assertEqual(document.status, Document.STATUS_COMPLETED)
+        self.assertEqual(self.extract_delay.call_count, 1)
+        self.index_delay.assert_not_called()
+
+    def test_patch_with_identical_bytes_retries_failed_extraction(self):
+        document = self.upload('manual.txt', b'Manual text')
+        Document.objects.filter(pk=document.id).update(
+            extracted_text=f"{EXTRACTION_ERROR_PREFIX}: boom", status=Document.STATUS_FAILED)
+        cache.clear()
+
+        document = self.replace_file(document, 'manual_again.txt', b'Manual text')
+        self.assertEqual(self.extract_delay.call_count, 2)
+        self.assertEqual(document.status, Document.STATUS_COMPLETED)
+        self.assertEqual(document.extracted_text, 'Manual text')
+
+    def test_extraction_error_is_not_cached(self):
+        upload = SimpleUploadedFile('broken.txt', b'Broken file')
+        content_hash = compute_file_hash(upload)
+        error_text = f"{EXTRACTION_ERROR_PREFIX}: boom"
+        with mock.patch('api.utils.extract_text_from_file', return_value=error_text):
+            self.assertEqual(extract_text_from_file_cached(upload, content_hash), error_text)
+        self.assertIsNone(get_cached_extracted_text(content_hash))
+
+        self.assertEqual(extract_text_from_file_cached(upload, content_hash), 'Broken file')
+        self.assertEqual(get_cached_extracted_text(content_hash), 'Broken file')
+
+    def test_name_dependent_result_is_not_cached(self):
+        # libmagic can't tell what this is, so the file name decides
+        content = b'PK\x03\x04' + bytes(range(256)) * 4
+        as_zip = SimpleUploadedFile('x.zip', content)
+        content_hash = compute_file_hash(as_zip)
+        self.assertTrue(extract_text_from_file_cached(as_zip, content_hash).startswith('Unsupported file type'))
+        self.assertIsNone(get_cached_extracted_text(content_hash))
+
+
+class ExtractionTaskTests(DocumentUploadTestCase):
+    def create_pending_document(self, content_hash):
+        document = Document(user=self.user, title='Doc', content_hash=content_hash, status=Document.STATUS_PENDING)
+        document.file.save('old.txt', ContentFile(b'Old file text'), save=False)
+        document.save()
+        return document
+
+    def test_stale_task_does_not_overwrite_replaced_file(self):
+        document = self.create_pending_document('old-hash')
+
+        def replace_during_extraction(file_obj, content_hash):
+            # The user uploads a new file while the worker is still extracting the old one
+            Document.objects.filter(pk=document.id).update(content_hash='new-hash')
+            return 'Old file text'
+
+        with mock.patch('api.tasks.extract_text_from_file_cached', side_effect=replace_during_extraction):
+            extract_document_text(document.id)
+
+        document.refresh_from_db()
+        self.assertEqual(document.status, Document.STATUS_PENDING)
+        self.assertFalse(document.extracted_text)
+        self.assertFalse(DocumentChunk.objects.filter(document=document).exists())
+
+    def test_index_skips_document_whose_file_changed(self):
+        document = self.create_pending_document('new-hash')
+        Document.objects.filter(pk=document.id).update(extracted_text='New file text', status=Document.STATUS_COMPLETED)
+        index_document_chunks(document.id, 'old-hash')
+        self.assertFalse(DocumentChunk.objects.filter(document=document).exists())
+        index_document_chunks(document.id, 'new-hash')
+        self.assertEqual(DocumentChunk.objects.filter(document=document).count(), 1)
+
+
+
+class DocumentFileCleanupTests(DocumentUploadTestCase):
+    def test_replacing_file_deletes_old_file(self):
+        document = self.upload('first.txt', b'First version')
+        old_path = document.file.path
+        document = self.replace_file(document, 'second.txt', b'Second version')
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(document.file.path))
+
+    def test_deleting_document_deletes_file(self):
+        document = self.upload('notes.txt', b'Some notes')
+        path = document.file.path
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('document-detail', args=[document.id]))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(os.path.exists(path))
+
+    def test_save_without_new_file_keeps_file(self):
+        document = self.upload('notes.txt', b'Some notes')
+        path = document.file.path
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('document-detail', args=[document.id]), {'title': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(os.path.exists(path))
+
+
+class AskAIContextTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='dave', email='dave@example.com', password='pass12345!')
+        self.client.force_authenticate(self.user)
+        self.document = Document.objects.create(user=self.user, title='Manual', file='user_documents/m.txt',
+                                                extracted_text='Full document text', status=Document.STATUS_COMPLETED)
+        # Chunks 0 and 4 are unrelated to the question, the rest match it more or less closely
+        vectors = [[0.0, 1.0], [0.9, 0.1], [1.0, 0.0], [0.7, 0.3], [0.0, 1.0], [0.8, 0.2], [0.6, 0.4], [0.95, 0.05]]
+        for i, vector in enumerate(vectors):
+            DocumentChunk.objects.create(document=self.document, index=i, text=f'chunk {i}', embedding=vector)
+
+    def get_context(self, document):
+        return DocumentViewSet().get_ai_context(document, 'question?')
+
+    def test_top_chunks_are_picked_by_similarity_in_reading_order(self):
+        with mock.patch('api.views.embed_texts', return_value=[[1.0, 0.0]]):
+            context = self.get_context(self.document)
+        self.assertEqual(context, '\n...\n'.join(f'chunk {i}' for i in (1, 2, 3, 5, 6, 7)))
+
+    def test_falls_back_to_truncated_text_when_question_embedding_fails(self):
+        Document.objects.filter(pk=self.document.id).update(extracted_text='x' * (AI_CONTEXT_MAX_CHARS + 100))
+        self.document.refresh_from_db()
+        with mock.patch('api.views.embed_texts', side_effect=RuntimeError('API down')):
+            context = self.get_context(self.document)
+        self.assertEqual(context, 'x' * AI_CONTEXT_MAX_CHARS)
+
+    def test_falls_back_to_full_text_without_chunks(self):
+        DocumentChunk.objects.all().delete()
+        with mock.patch('api.views.embed_texts') as embed:
+            context = self.get_context(self.document)
+        self.assertEqual(context, 'Full document text')
+        embed.assert_not_called()
+
+    def test_ask_ai_prompt_contains_only_selected_chunks(self):
+        model = mock.Mock()
+        model.generate_content.return_value = mock.Mock(text='The answer')
+        with mock.patch('api.views.embed_texts', return_value=[[1.0, 0.0]]), \
+             mock.patch('api.views.configure_gemini', return_value=True), \
+             mock.patch('api.views.get_gemini_model', return_value=model):
+            response = self.client.post(reverse('document-ask-ai', args=[self.document.id]),
+                                        {'question': 'question?'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['answer'], 'The answer')
+        prompt = model.generate_content.call_args.args[0]
+        self.assertIn('chunk 7', prompt)
+        self.assertNotIn('chunk 0', prompt)
+        self.assertNotIn('chunk 4', prompt)
+        self.assertNotIn('Full document text', prompt)
+
+    def test_index_stores_no_chunks_when_embeddings_are_missing(self):
+        DocumentChunk.objects.all().delete()
+        Document.objects.filter(pk=self.document.id).update(extracted_text=' '.join(['word'] * 1000))
+        with mock.patch('api.tasks.embed_texts', return_value=[[1.0, 0.0]]): # Fewer than the chunks
+            index_document_chunks(self.document.id, self.document.content_hash)
+        self.assertFalse(DocumentChunk.objects.filter(document=self.document).exists())
 
-# Create your tests here.
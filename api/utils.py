@@ -1,11 +1,156 @@
-import PyPDF2
+import pymupdf # PyMuPDF
 import docx # from python-docx
 import mimetypes # Standard Python library
+import magic # from python-magic (needs the libmagic system library)
+import hashlib # Standard Python library
+import codecs # Standard Python library
+import subprocess # Standard Python library
+import tempfile # Standard Python library
+import math # Standard Python library
+import os # Standard Python library
+import functools # Standard Python library
+from concurrent.futures import ThreadPoolExecutor # Standard Python library
+from django.core.cache import cache
+from django.core.files.uploadedfile import TemporaryUploadedFile
+import google.generativeai as genai # Gemini API client
+
+# Read uploads in 1 MiB pieces when hashing so large files never sit fully in memory
+HASH_CHUNK_SIZE = 1024 * 1024
+EXTRACTED_TEXT_CACHE_PREFIX = "doctext:sha256:"
+EXTRACTED_TEXT_CACHE_TIMEOUT = 60 * 60 * 24 * 7 # A week; re-uploads of a file usually happen soon after the first
+EXTRACTION_ERROR_PREFIX = "An error occurred during text extraction"
+DOC_EXTRACTION_ERROR_PREFIX = "Could not reliably extract text from .doc file"
+# Results that aren't cached: errors may go away on a retry, and when libmagic can't tell the
+# type the "unsupported"/"no text" verdict depends on the file name, which isn't in the cache key
+_UNCACHED_RESULT_PREFIXES = (
+    EXTRACTION_ERROR_PREFIX,
+    DOC_EXTRACTION_ERROR_PREFIX, # e.g. antiword not installed yet
+    "Unsupported file type",
+    "No text content could be extracted",
+)
+# ASCII control characters other than tab/newline/carriage return, used to spot binary content
+_CONTROL_BYTES = bytes(range(32)).translate(None, b"\t\n\r") + b"\x7f"
+
+# How much of the file libmagic looks at to identify its type
+SNIFF_HEADER_SIZE = 4096
+# Content types libmagic reports for the formats we can extract
+_SNIFFED_KINDS = {
+    'application/pdf': 'pdf',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'docx',
+    'application/msword': 'doc',
+    'application/x-ole-storage': 'doc', # Legacy Word files are OLE compound documents
+    'application/CDFV2': 'doc',
+    'application/x-empty': 'text', # Reported as "no text content" below
+}
+# Text formats libmagic reports under application/ rather than text/
+_TEXTUAL_APPLICATION_TYPES = {
+    'application/json',
+    'application/xml',
+    'application/javascript',
+    'application/x-javascript',
+    'application/x-sh',
+    'application/x-shellscript',
+    'application/x-ndjson',
+    'application/yaml',
+    'application/x-yaml',
+    'application/sql',
+    'application/csv',
+}
+
+# Roughly 500 tokens per chunk, with a small overlap so answers spanning a boundary aren't lost
+CHUNK_SIZE_WORDS = 375
+CHUNK_OVERLAP_WORDS = 40
+# Texts per embedding API request (the API's batch limit), and how many requests may run at once
+EMBEDDING_BATCH_SIZE = 100
+EMBEDDING_MAX_WORKERS = 10
+
+def _get_local_file_path(file_obj):
+    """
+    Returns a filesystem path for the file if it already lives on local disk
+    (a spooled TemporaryUploadedFile, or a stored FieldFile on FileSystemStorage),
+    so parsers can read it directly instead of us buffering its bytes. None otherwise.
+    """
+    if isinstance(file_obj, TemporaryUploadedFile):
+        return file_obj.temporary_file_path()
+    storage = getattr(file_obj, 'storage', None) # Set on FieldFile
+    if storage is not None:
+        try:
+            return storage.path(file_obj.name)
+        except NotImplementedError: # Remote storage (e.g. S3) has no local path
+            return None
+    return None
+
+def _decode_text_file(file_obj):
+    """
+    Decodes a text upload as UTF-8 chunk by chunk, so the raw bytes are never
+    held in memory alongside the decoded string.
+    """
+    if not hasattr(file_obj, 'chunks'): # Plain file object
+        return file_obj.read().decode('utf-8', errors='ignore')
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    parts = [decoder.decode(chunk) for chunk in file_obj.chunks(chunk_size=HASH_CHUNK_SIZE)]
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
+
+def _extract_doc_text(file_obj):
+    """
+    Extracts text from a legacy Word (.doc) file with the 'antiword' command-line tool.
+    Uploads that aren't on local disk are spooled to a temporary file first.
+    Raises FileNotFoundError if antiword isn't installed.
+    """
+    local_path = _get_local_file_path(file_obj)
+    if local_path:
+        proc = subprocess.run(['antiword', local_path], capture_output=True, timeout=30)
+    else:
+        with tempfile.NamedTemporaryFile(suffix='.doc') as tmp:
+            if hasattr(file_obj, 'chunks'):
+                for chunk in file_obj.chunks(chunk_size=HASH_CHUNK_SIZE):
+                    tmp.write(chunk)
+            else:
+                tmp.write(file_obj.read())
+            tmp.flush()
+            proc = subprocess.run(['antiword', tmp.name], capture_output=True, timeout=30)
+    if proc.returncode != 0:
+        raise ValueError(proc.stderr.decode('utf-8', errors='ignore').strip() or f"antiword exited with code {proc.returncode}")
+    return proc.stdout.decode('utf-8', errors='ignore')
+
+def _sniff_mime_type(header):
+    """
+    Identifies a file's content type from its first bytes with libmagic. None if it can't tell.
+    """
+    try:
+        return magic.from_buffer(header, mime=True)
+    except magic.MagicException:
+        return None
+
+def _is_textual_type(content_type):
+    """
+    True for content types that are plain text underneath (text/*, JSON, XML, scripts, ...).
+    """
+    return content_type.startswith('text/') or content_type in _TEXTUAL_APPLICATION_TYPES or \
+        content_type.endswith('+json') or content_type.endswith('+xml')
+
+def _get_file_kind(file_name, mime_type):
+    """
+    Guesses the file kind ('pdf', 'docx', 'doc' or 'text') from its name and declared MIME type. None if unknown.
+    """
+    lower_name = file_name.lower()
+    if mime_type == 'application/pdf' or lower_name.endswith('.pdf'):
+        return 'pdf'
+    if lower_name.endswith('.docx') or mime_type == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document':
+        return 'docx'
+    if lower_name.endswith('.doc') or mime_type == 'application/msword':
+        return 'doc'
+    if mime_type == 'text/plain' or lower_name.endswith('.txt'):
+        return 'text'
+    return None
 
 def extract_text_from_file(file_obj):
     """
-    Extracts text content from an in-memory uploaded file object.
-    Supports PDF, DOCX, and TXT files.
+    Extracts text content from an uploaded or stored file object.
+    Files already on local disk are parsed from their path rather than read into memory.
+    The format is identified from the file's first bytes, falling back to its name.
+    Supports PDF, DOCX, DOC, and plain text files.
     """
     text = ""
     # Ensure file pointer is at the beginning for reading
@@ -21,47 +166,177 @@ def extract_text_from_file(file_obj):
         mime_type = file_obj.content_type
 
     try:
-        if mime_type == 'application/pdf' or file_name.lower().endswith('.pdf'):
-            reader = PyPDF2.PdfReader(file_obj)
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text: # Ensure text was extracted
-                    text += page_text + "\n"
-        elif mime_type in ['application/vnd.openxmlformats-officedocument.wordprocessingml.document', 'application/msword'] or \
-             file_name.lower().endswith('.docx') or file_name.lower().endswith('.doc'):
-            # python-docx primarily handles .docx. For .doc, it might be limited or require other tools.
-            if file_name.lower().endswith('.docx'):
-                doc = docx.Document(file_obj)
-                for para in doc.paragraphs:
-                    text += para.text + "\n"
-            else: # Basic attempt for .doc or if type is 'application/msword'
-                try:
-                    # This is a very naive attempt for .doc, might not work well
-                    text = file_obj.read().decode('latin-1', errors='ignore') # Or 'cp1252'
-                except Exception as e_doc:
-                    text = f"Could not reliably extract text from .doc file: {e_doc}\n"
-        elif mime_type == 'text/plain' or file_name.lower().endswith('.txt'):
-            text = file_obj.read().decode('utf-8', errors='ignore') # Be robust with decoding
+        # The name and declared content type can be wrong (or spoofed), so look at the content first
+        header = file_obj.read(SNIFF_HEADER_SIZE)
+        file_obj.seek(0)
+        sniffed_type = _sniff_mime_type(header)
+        if sniffed_type in _SNIFFED_KINDS:
+            file_kind = _SNIFFED_KINDS[sniffed_type]
+        elif sniffed_type and _is_textual_type(sniffed_type):
+            file_kind = 'text'
         else:
-            # Fallback: try to read as text if it's an unknown but potentially text-based type
+            # Inconclusive (e.g. octet-stream, or zip for a .docx) or a type we don't know:
+            # the file name/declared type decides instead
+            file_kind = _get_file_kind(file_name, mime_type)
+            if file_kind == 'text':
+                # Nothing vouches for this being text but its name, so check for binary content.
+                # bytes.translate deletes the control bytes in C; the length difference is their count.
+                sample = header[:500]
+                if len(sample) - len(sample.translate(None, _CONTROL_BYTES)) >= 50:
+                    file_kind = None
+
+        if file_kind == 'pdf':
+            local_path = _get_local_file_path(file_obj)
+            if local_path:
+                doc = pymupdf.open(local_path, filetype="pdf")
+            else:
+                doc = pymupdf.open(stream=file_obj.read(), filetype="pdf")
+            try:
+                text = "\n".join(page.get_text("text") for page in doc)
+            finally:
+                doc.close()
+        elif file_kind == 'docx':
+            doc = docx.Document(file_obj)
+            text = "\n".join(para.text for para in doc.paragraphs)
+        elif file_kind == 'doc':
             try:
-                possible_text = file_obj.read().decode('utf-8', errors='ignore')
-                # A simple check: if it contains many non-printable chars, it's likely not plain text.
-                if sum(1 for char in possible_text[:500] if not char.isprintable() and char not in '\n\r\t') < 50:
-                    text = possible_text
-                else:
-                    text = "Unsupported file type or content not recognized as plain text."
-            except Exception:
-                text = f"Unsupported file type ({mime_type or 'unknown'}). Could not decode as text."
+                text = _extract_doc_text(file_obj)
+            except FileNotFoundError:
+                # Without antiword the raw bytes are OLE binary, not text worth keeping or sending to the AI
+                print("antiword is not installed; .doc files can't be extracted (see Aptfile)")
+                text = f"{DOC_EXTRACTION_ERROR_PREFIX}: antiword is not installed on the server.\n"
+            except Exception as e_doc:
+                text = f"{DOC_EXTRACTION_ERROR_PREFIX}: {e_doc}\n"
+        elif file_kind == 'text':
+            text = _decode_text_file(file_obj) # Be robust with decoding
+        else:
+            # Not a format we can extract; decided from the header and name, without reading the rest
+            text = "Unsupported file type or content not recognized as plain text."
 
         if not text.strip(): # If no text was extracted, provide a default message
             text = "No text content could be extracted from the document."
 
     except Exception as e:
         print(f"Error extracting text from '{file_name}' (MIME: {mime_type}): {str(e)}")
-        text = f"An error occurred during text extraction: {str(e)}"
+        text = f"{EXTRACTION_ERROR_PREFIX}: {str(e)}"
     finally:
         # Reset file pointer again so Django can save the file if it needs to
         if hasattr(file_obj, 'seek') and callable(file_obj.seek):
             file_obj.seek(0)
-    return text.strip()
\ No newline at end of file
+    return text.strip()
+
+def compute_file_hash(file_obj):
+    """
+    Returns the SHA-256 hex digest of an uploaded file's contents.
+    The file pointer is reset to the beginning afterwards.
+    """
+    digest = hashlib.sha256()
+    if hasattr(file_obj, 'seek') and callable(file_obj.seek):
+        file_obj.seek(0)
+    if hasattr(file_obj, 'chunks'): # Django UploadedFile / File
+        for chunk in file_obj.chunks(chunk_size=HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    else:
+        for chunk in iter(lambda: file_obj.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    if hasattr(file_obj, 'seek') and callable(file_obj.seek):
+        file_obj.seek(0)
+    return digest.hexdigest()
+
+def extract_text_from_file_cached(file_obj, content_hash=None):
+    """
+    Same as extract_text_from_file, but keyed by the SHA-256 of the file bytes
+    so identical uploads only pay the extraction cost once.
+    Pass content_hash if it was already computed to avoid hashing twice.
+    """
+    if content_hash is None:
+        content_hash = compute_file_hash(file_obj)
+    text = get_cached_extracted_text(content_hash)
+    if text is None:
+        text = extract_text_from_file(file_obj)
+        if not text.startswith(_UNCACHED_RESULT_PREFIXES):
+            try:
+                cache.set(f"{EXTRACTED_TEXT_CACHE_PREFIX}{content_hash}", text, EXTRACTED_TEXT_CACHE_TIMEOUT)
+            except Exception as e: # Cache unavailable (e.g. Redis down), the text just isn't reused
+                print(f"Error caching extracted text for {content_hash}: {str(e)}")
+    return text
+
+def get_cached_extracted_text(content_hash):
+    """
+    Returns previously extracted text for a file with this SHA-256, or None on a cache miss.
+    An unreachable cache counts as a miss, so uploads keep working without it.
+    """
+    try:
+        return cache.get(f"{EXTRACTED_TEXT_CACHE_PREFIX}{content_hash}")
+    except Exception as e:
+        print(f"Error reading extracted text cache for {content_hash}: {str(e)}")
+        return None
+
+def split_text_into_chunks(text, chunk_size=CHUNK_SIZE_WORDS, overlap=CHUNK_OVERLAP_WORDS):
+    """
+    Splits text into overlapping chunks of about chunk_size words.
+    """
+    words = text.split()
+    if not words:
+        return []
+    step = max(chunk_size - overlap, 1)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_size]))
+        if start + chunk_size >= len(words):
+            break
+    return chunks
+
+@functools.lru_cache(maxsize=1)
+def _configure_gemini_client(api_key):
+    genai.configure(api_key=api_key)
+
+def configure_gemini():
+    """
+    Configures the Gemini client with GEMINI_API_KEY, only the first time (or when the key changes).
+    Returns False if the key isn't set.
+    """
+    gemini_api_key = os.getenv("GEMINI_API_KEY")
+    if not gemini_api_key:
+        return False
+    _configure_gemini_client(gemini_api_key)
+    return True
+
+@functools.lru_cache(maxsize=4)
+def get_gemini_model(model_name):
+    """
+    Returns a shared GenerativeModel per model name instead of building one per request.
+    Call configure_gemini() first.
+    """
+    return genai.GenerativeModel(model_name)
+
+def embed_texts(texts, task_type="retrieval_document"):
+    """
+    Returns one embedding (list of floats) per text using Gemini's embedding model.
+    Use task_type="retrieval_query" when embedding a user's question.
+    """
+    if not configure_gemini():
+        raise RuntimeError("GEMINI_API_KEY environment variable is not set.")
+    model_name = os.getenv("GEMINI_EMBEDDING_MODEL_NAME", "models/text-embedding-004")
+    texts = list(texts)
+    batches = [texts[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(texts), EMBEDDING_BATCH_SIZE)]
+
+    def embed_batch(batch):
+        return genai.embed_content(model=model_name, content=batch, task_type=task_type)['embedding']
+
+    if len(batches) <= 1:
+        return embed_batch(texts) if texts else []
+    # Long documents need several requests; they're network-bound, so send them concurrently
+    with ThreadPoolExecutor(max_workers=min(len(batches), EMBEDDING_MAX_WORKERS)) as executor:
+        return [embedding for batch_embeddings in executor.map(embed_batch, batches) for embedding in batch_embeddings]
+
+def cosine_similarity(vec_a, vec_b):
+    """
+    Cosine similarity between two equal-length vectors, 0.0 if either is all zeros.
+    """
+    dot = sum(a * b for a, b in zip(vec_a, vec_b))
+    norm_a = math.sqrt(sum(a * a for a in vec_a))
+    norm_b = math.sqrt(sum(b * b for b in vec_b))
+    if not norm_a or not norm_b:
+        return 0.0
+    return dot / (norm_a * norm_b)
@@ -1,9 +1,9 @@
 # your_project_name/backend/api/views.py
 
-import os # Standard Python library for OS interaction (file paths, deletion)
-from dotenv import load_dotenv # For loading environment variables from .env
+import os # Standard Python library for OS interaction (environment variables)
 
 from django.contrib.auth.models import User # Django's built-in User model
+from django.db import transaction
 # from django.conf import settings # Not strictly needed here with current os.path usage
 
 from rest_framework import generics, viewsets, permissions, status, serializers
@@ -11,15 +11,26 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework_simplejwt.tokens import RefreshToken, TokenError
 
-import google.generativeai as genai # Gemini API client
-
 from .models import Document # Your Document model
-from .serializers import UserSerializer, DocumentSerializer # Your serializers
-from .utils import extract_text_from_file # Your text extraction utility
-
-# Load environment variables from .env file located in 'your_project_name/backend/'
-# Ensure .env is in your_project_name/backend/
-load_dotenv()
+from .serializers import UserSerializer, DocumentSerializer, DocumentListSerializer # Your serializers
+from .utils import compute_file_hash, get_cached_extracted_text, embed_texts, cosine_similarity, configure_gemini, get_gemini_model, EXTRACTION_ERROR_PREFIX, DOC_EXTRACTION_ERROR_PREFIX # Your text extraction and AI utilities
+from .tasks import extract_document_text, index_document_chunks # Background text extraction (Celery)
+
+# How many of the most relevant chunks of a document are sent to the AI model per question
+AI_CONTEXT_CHUNKS = 6
+# Cap on document text sent to the AI model when the document has no indexed chunks
+AI_CONTEXT_MAX_CHARS = 30000
+
+# Extraction results that mean there is no usable document text to ask the AI about
+_UNSUITABLE_EXACT = frozenset({
+    "No text content could be extracted from the document.",
+    "Unsupported file type or content not recognized as plain text.",
+})
+_UNSUITABLE_PREFIXES = (
+    EXTRACTION_ERROR_PREFIX,
+    "Unsupported file type",
+    DOC_EXTRACTION_ERROR_PREFIX,
+)
 
 # --- Authentication Related Views ---
 
@@ -79,8 +90,22 @@ class DocumentViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """
         Ensures users only see their own documents, ordered by most recently uploaded.
+        The owner is joined in so the serializer's 'user.username' doesn't cost a query per row.
+        The list view only loads the columns DocumentListSerializer needs,
+        skipping the (potentially huge) extracted_text column.
         """
-        return Document.objects.filter(user=self.request.user).order_by('-uploaded_at')
+        queryset = Document.objects.select_related('user').filter(user=self.request.user).order_by('-uploaded_at')
+        if self.action == 'list':
+            queryset = queryset.only('id', 'title', 'file', 'uploaded_at', 'status', 'user__username')
+        return queryset
+
+    def get_serializer_class(self):
+        """
+        Uses a serializer without 'extracted_text' for the list view, so the skipped column isn't loaded per row.
+        """
+        if self.action == 'list':
+            return DocumentListSerializer
+        return DocumentSerializer
 
     def get_serializer_context(self):
         """
@@ -93,85 +118,104 @@ class DocumentViewSet(viewsets.ModelViewSet):
         """
         Called when a new document is being created (POST request).
         - Associates the document with the currently authenticated user.
-        - Extracts text from the uploaded file.
+        - Queues text extraction from the uploaded file on a Celery worker,
+          so the upload response isn't blocked by parsing.
         """
         document_file = self.request.FILES.get('file') # Get the uploaded file from the request
 
         # Serializer should handle 'file' field validation (e.g. if it's required)
         # If file is optional and not provided, handle appropriately
         extracted_text = ""
+        content_hash = ""
+        document_status = Document.STATUS_COMPLETED
         if document_file:
-            extracted_text = extract_text_from_file(document_file)
+            content_hash = compute_file_hash(document_file)
+            cached_text = get_cached_extracted_text(content_hash)
+            if cached_text is not None: # Same file was extracted before, no need for the worker
+                extracted_text = cached_text
+            else:
+                document_status = Document.STATUS_PENDING
         else:
             # If 'file' is optional and not provided, decide on default extracted_text
             # For this app, a document without a file might not make sense for AI Q&A
             # Consider making 'file' required in the serializer or handling this case
             pass # Assuming 'file' is required by the serializer for now
 
-        serializer.save(user=self.request.user, extracted_text=extracted_text)
+        instance = serializer.save(user=self.request.user, extracted_text=extracted_text,
+                                   content_hash=content_hash, status=document_status)
+        if document_status == Document.STATUS_PENDING:
+            # Wait for the row to be committed so the worker can see it
+            transaction.on_commit(lambda: extract_document_text.delay(instance.id))
+        elif extracted_text:
+            transaction.on_commit(lambda: index_document_chunks.delay(instance.id, content_hash))
 
     def perform_update(self, serializer):
         """
         Called when an existing document is being updated (PUT or PATCH request).
-        - If a new file is uploaded, the old physical file is deleted (after successful save).
-        - Text is re-extracted from the new file.
+        - If a new file is uploaded, the old stored file is deleted by a signal (see api/signals.py).
+        - Text is re-extracted from the new file in the background, unless its contents match the current one.
         """
         document_instance = serializer.instance # The existing document object before update
-        old_file_path = None
-        if document_instance.file and hasattr(document_instance.file, 'path'):
-            old_file_path = document_instance.file.path # Get path of the current physical file
 
         # Check if a new file is part of the update data (will be in serializer.validated_data if so)
         new_file_uploaded = 'file' in serializer.validated_data
         extracted_text_to_save = document_instance.extracted_text # Default to old text
+        content_hash_to_save = document_instance.content_hash
+        status_to_save = document_instance.status
+        text_changed = False
 
         if new_file_uploaded:
             new_file_obj = serializer.validated_data['file'] # The new UploadedFile object
             if new_file_obj: # Check if a new file object actually exists
-                 extracted_text_to_save = extract_text_from_file(new_file_obj)
+                 new_content_hash = compute_file_hash(new_file_obj)
+                 # Same bytes as the stored file and extraction finished: the existing text is still valid.
+                 # A failed (or stuck pending) extraction is retried though, re-uploading is how users retry.
+                 if new_content_hash != document_instance.content_hash or \
+                    document_instance.status != Document.STATUS_COMPLETED:
+                     text_changed = True
+                     content_hash_to_save = new_content_hash
+                     cached_text = get_cached_extracted_text(new_content_hash)
+                     if cached_text is not None:
+                         extracted_text_to_save = cached_text
+                         status_to_save = Document.STATUS_COMPLETED
+                     else:
+                         extracted_text_to_save = ""
+                         status_to_save = Document.STATUS_PENDING
             else: # A 'file': null might have been sent to clear the file
+                 text_changed = True
                  extracted_text_to_save = "" # Clear extracted text if file is cleared
+                 content_hash_to_save = ""
+                 status_to_save = Document.STATUS_COMPLETED
 
 
         # Save the instance. If a new file was uploaded and validated,
         # serializer.save() will update document_instance.file field automatically.
         # If 'file': null was sent (and model field allows null), it will clear the file field.
-        updated_instance = serializer.save(extracted_text=extracted_text_to_save)
-
-        # After successful save, if a new file was uploaded (or file was cleared) and there was an old file, delete the old one
-        if (new_file_uploaded or (not updated_instance.file and old_file_path)) and old_file_path:
-            # Ensure the file path actually changed or was cleared, and the old file exists
-            file_effectively_changed = True
-            if updated_instance.file and hasattr(updated_instance.file, 'path'):
-                if updated_instance.file.path == old_file_path:
-                    file_effectively_changed = False # Same file path, don't delete
-
-            if file_effectively_changed and os.path.isfile(old_file_path):
-                try:
-                    os.remove(old_file_path)
-                except OSError as e:
-                    print(f"Error deleting old file {old_file_path} after update: {e}") # Log error
-
-
-    def perform_destroy(self, instance):
+        updated_instance = serializer.save(extracted_text=extracted_text_to_save,
+                                           content_hash=content_hash_to_save, status=status_to_save)
+        if text_changed:
+            if status_to_save == Document.STATUS_PENDING:
+                transaction.on_commit(lambda: extract_document_text.delay(updated_instance.id))
+            else: # Text came from the cache (or was cleared), just rebuild the chunks
+                transaction.on_commit(lambda: index_document_chunks.delay(updated_instance.id, content_hash_to_save))
+
+    def get_ai_context(self, document, question):
         """
-        Called when a document is being deleted (DELETE request).
-        - Deletes the associated physical file from storage (after DB record deletion).
+        Picks the document text to send to the AI model for a question.
+        Uses the chunks most similar to the question when the document has been indexed,
+        otherwise falls back to the full text, truncated to AI_CONTEXT_MAX_CHARS.
         """
-        file_path_to_delete = None
-        if instance.file and hasattr(instance.file, 'path'):
-            file_path_to_delete = instance.file.path
-
-        # First, delete the database record
-        instance.delete()
-
-        # After successful DB deletion, delete the physical file
-        if file_path_to_delete and os.path.isfile(file_path_to_delete):
+        chunks = list(document.chunks.all())
+        if chunks:
             try:
-                os.remove(file_path_to_delete)
-            except OSError as e:
-                print(f"Error deleting physical file {file_path_to_delete} after DB record deletion: {e}")
-
+                question_embedding = embed_texts([question], task_type="retrieval_query")[0]
+            except Exception as e:
+                print(f"Error embedding question for document {document.id}: {str(e)}")
+            else:
+                ranked = sorted(chunks, key=lambda chunk: cosine_similarity(question_embedding, chunk.embedding), reverse=True)
+                top_chunks = sorted(ranked[:AI_CONTEXT_CHUNKS], key=lambda chunk: chunk.index) # Keep reading order
+                return "\n...\n".join(chunk.text for chunk in top_chunks)
+        return document.extracted_text[:AI_CONTEXT_MAX_CHARS]
 
     @action(detail=True, methods=['post'], url_path='ask-ai', permission_classes=[permissions.IsAuthenticated])
     def ask_ai(self, request, pk=None):
@@ -186,31 +230,27 @@ class DocumentViewSet(viewsets.ModelViewSet):
         if not question or not isinstance(question, str) or not question.strip():
             return Response({"error": "A non-empty 'question' string is required in the request body."}, status=status.HTTP_400_BAD_REQUEST)
 
+        if document.status == Document.STATUS_PENDING:
+            return Response({"error": "Text extraction for this document is still in progress. Please try again shortly."}, status=status.HTTP_409_CONFLICT)
+
         # Check if extracted text is valid for querying
-        unsuitable_text_messages = [
-            "No text content could be extracted from the document.",
-            "Unsupported file type or content not recognized as plain text.",
-            "Unsupported file type (unknown). Could not decode as text.",
-            "An error occurred during text extraction", # Check for startswith this
-            "Could not reliably extract text from .doc file"
-        ]
         if not document.extracted_text or \
-           document.extracted_text in unsuitable_text_messages or \
-           any(document.extracted_text.startswith(msg_start) for msg_start in ["An error occurred during text extraction", "Unsupported file type"]):
+           document.extracted_text in _UNSUITABLE_EXACT or \
+           document.extracted_text.startswith(_UNSUITABLE_PREFIXES):
             return Response({
                 "error": "Document content is not available or suitable for AI querying.",
                 "extracted_text_status": document.extracted_text # Provide status for debugging
             }, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            gemini_api_key = os.getenv("GEMINI_API_KEY")
-            if not gemini_api_key:
+            if not configure_gemini(): # Only configures the client on first use
                 print("CRITICAL SERVER ERROR: GEMINI_API_KEY environment variable is not set.") # Server log
                 return Response({"error": "AI service is currently unavailable. Please contact support."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            genai.configure(api_key=gemini_api_key)
             model_name = os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash-latest") # Allow model override via .env
-            model = genai.GenerativeModel(model_name)
+            model = get_gemini_model(model_name) # Reused across requests
+
+            document_context = self.get_ai_context(document, question)
 
             # Enhanced prompt for better AI guidance
             prompt = f"""You are an AI assistant for a Document Management Portal.
@@ -222,7 +262,7 @@ Your sole task is to answer the user's question based *strictly and exclusively*
 
 Provided Document Text:
 ---
-{document.extracted_text}
+{document_context}
 ---
 
 User's Question: {question}
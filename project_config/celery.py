@@ -0,0 +1,20 @@
+"""
+Celery application for project_config project.
+
+Workers are started with:
+    celery -A project_config worker --loglevel=info
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project_config.settings")
+
+app = Celery("project_config")
+
+# Read CELERY_* settings from Django's settings.py
+app.config_from_object("django.conf:settings", namespace="CELERY")
+
+# Picks up tasks.py from every installed app (e.g. api/tasks.py)
+app.autodiscover_tasks()
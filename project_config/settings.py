@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
 from pathlib import Path
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
 import dj_database_url
 
@@ -68,6 +69,9 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    # List endpoints return pages of 25 ({count, next, previous, results}); use ?page=N for more
+    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'PAGE_SIZE': 25,
     # Optional: Set default permission policy (e.g., all views require authentication by default)
     # 'DEFAULT_PERMISSION_CLASSES': [
     #     'rest_framework.permissions.IsAuthenticated',
@@ -107,6 +111,35 @@ DATABASES = {
 DATABASE_URL = os.getenv('DATABASE_URL')
 if DATABASE_URL:
     DATABASES['default'] = dj_database_url.parse(DATABASE_URL)
+
+# Celery (background text extraction)
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+# Nothing reads task results (tasks write to the database themselves), so don't store them
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_ACCEPT_CONTENT = ['json']
+# Set to true to run tasks inline (e.g. local development without Redis)
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', 'False').lower() in ('true', '1', 't')
+
+# Cache shared by the web and worker processes (e.g. extracted text keyed by file hash),
+# so it can't be the default per-process LocMemCache. Set CACHE_URL to choose the Redis instance/DB;
+# otherwise DB 1 of the broker's Redis is used, keeping cached text apart from the Celery queues.
+# When tasks run inline without a CACHE_URL there is only one process, so a local cache is enough.
+CACHE_URL = os.getenv('CACHE_URL')
+if not CACHE_URL and CELERY_TASK_ALWAYS_EAGER:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL or urlsplit(CELERY_BROKER_URL)._replace(path='/1').geturl(),
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -153,6 +186,9 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 MEDIA_URL = '/media/'
 # BASE_DIR already points to your 'backend/' folder because manage.py is there
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Uploads above 1 MiB are spooled to a temporary file instead of kept in memory (Django's default is 2.5 MiB),
+# and text extraction reads them straight from that path
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
 
 CORS_ALLOW_ALL_ORIGINS = True
 # For production, you'd use: